@@ -0,0 +1,30 @@
+import configparser
+from functools import lru_cache
+
+# 配置文件路径（相对仓库根目录）
+CONFIG_FILE = 'conf/settings.ini'
+
+
+@lru_cache(maxsize=1)
+def load_config(filename=CONFIG_FILE):
+    """读取并缓存 settings.ini，返回 (数据库配置字典, Tushare token)
+
+    三个脚本共用同一份配置；lru_cache 保证每个进程只解析一次，
+    避免各模块重复维护几乎相同的解析逻辑。
+    """
+    parser = configparser.ConfigParser()
+    if not parser.read(filename):
+        # 考虑到运行环境可能在 src/ 内部，尝试相对路径
+        if not parser.read('../' + filename):
+            raise FileNotFoundError(f"错误：无法找到或读取配置文件: {filename} 或 ../{filename}")
+
+    db_config = dict(parser.items('DATABASE'))
+
+    # 检查核心配置项
+    if not all(k in db_config for k in ['user', 'password', 'host', 'port', 'database']):
+        raise ValueError("错误：settings.ini 文件中 [DATABASE] 配置项不完整。")
+
+    # [TSHARE] 仅数据爬取脚本需要；缺失时返回空串，由调用方决定是否校验
+    ts_token = parser.get('TSHARE', 'token', fallback='')
+
+    return db_config, ts_token
@@ -1,43 +1,30 @@
 import mysql.connector
-import configparser
-import os
+from functools import lru_cache
+from pathlib import Path
+
+from config import load_config
 
 # 定义 SQL 脚本文件路径
 SCHEMA_SQL_FILE = 'sql/01_schema_creation.sql'
 
 # --------------------------
-# 1. 配置读取函数
+# 1. SQL 文件加载函数
 # --------------------------
-def get_db_config(filename='conf/settings.ini', section='DATABASE'):
-    """从配置文件中读取数据库配置"""
-    parser = configparser.ConfigParser()
-    # 尝试读取 settings.ini 文件
-    if not parser.read(filename):
-        raise FileNotFoundError(f"无法找到或读取配置文件: {filename}")
-    
-    db_config = {}
-    if parser.has_section(section):
-        items = parser.items(section)
-        for item in items:
-            db_config[item[0]] = item[1]
-    else:
-        raise Exception(f'Section {section} not found in the {filename} file')
-        
-    return db_config
+@lru_cache(maxsize=8)
+def _read_sql_file(filepath, mtime):
+    """按 (路径, 修改时间) 缓存文件内容，文件被改动后缓存自动失效"""
+    return Path(filepath).read_text(encoding='utf-8')
 
-# --------------------------
-# 2. SQL 文件加载函数
-# --------------------------
 def load_sql_script(filepath):
-    """从文件中加载 SQL 脚本内容"""
-    if not os.path.exists(filepath):
+    """从文件中加载 SQL 脚本内容（同一文件重复调用不再读盘）"""
+    path = Path(filepath)
+    if not path.exists():
         raise FileNotFoundError(f"SQL 脚本文件未找到: {filepath}")
-    
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return f.read()
+
+    return _read_sql_file(str(path), path.stat().st_mtime)
 
 # --------------------------
-# 3. 数据库连接和执行函数
+# 2. 数据库连接和执行函数
 # --------------------------
 def execute_sql_script(sql_script, db_config):
     """连接数据库并执行SQL脚本"""
@@ -55,40 +42,35 @@ def execute_sql_script(sql_script, db_config):
         cursor = cnx.cursor()
         print("成功连接到数据库服务器。")
 
-        # 步骤 2: 分割并执行SQL语句
-        # 使用 ';' 分隔符分割SQL脚本
-        sql_commands = [cmd.strip() for cmd in sql_script.split(';') if cmd.strip()]
+        # 批量 DDL 期间关闭自动提交和约束检查：多条 CREATE TABLE + 外键
+        # 语句之间不再逐条做 fsync 和外键校验，脚本结束前统一恢复并提交
+        cnx.autocommit = False
+        cursor.execute("SET SESSION unique_checks=0")
+        cursor.execute("SET SESSION foreign_key_checks=0")
 
-        for command in sql_commands:
-            try:
-                # 针对 USE 语句的特殊处理：执行完 USE 语句后，我们重新连接到目标数据库
-                if command.strip().upper().startswith("USE"):
-                    cursor.execute(command)
-                    
-                    # 重新连接以确保所有后续操作都在新数据库上
-                    cursor.close()
-                    cnx.close()
-                    
-                    db_config['database'] = db_name # 恢复 database key
-                    cnx = mysql.connector.connect(**db_config)
-                    cursor = cnx.cursor()
-                    print(f"✅ 成功切换到数据库: {db_name}")
-                else:
-                    # 执行其他 DDL 语句 (CREATE TABLE, CREATE DATABASE IF NOT EXISTS 等)
-                    cursor.execute(command)
-                    
-                print(f"✅ 成功执行: {command[:50]}...")
-            except mysql.connector.Error as err:
-                # 忽略一些已存在的警告，但对其他错误抛出异常
-                if err.errno in [1050, 1007]: # 1050: 表已存在, 1007: 数据库已存在
-                    print(f"⚠️ 数据库或表已存在，跳过。")
-                else:
-                    print(f"❌ 执行失败: {command[:50]}...")
-                    print(f"错误信息: {err}")
-                    raise # 停止执行
+        # 步骤 2: 整个脚本一次性发送，由驱动逐条返回结果
+        # multi=True 在一次网络往返中发送整个批处理，省去逐条语句的等待；
+        # 也避免了在 Python 端按 ';' 切分（存储过程、注释、字符串字面量中
+        # 的分号都会让切分出错）。USE 语句在同一会话内直接生效。
+        # 任何语句出错都直接向外层传播终止执行：结果生成器在异常后无法
+        # 继续消费，"吞掉错误再继续"只会悄悄丢弃剩余语句；schema 脚本
+        # 全部使用 IF NOT EXISTS，"已存在"类错误本身也不会出现
+        for result in cursor.execute(sql_script, multi=True):
+            print(f"✅ 成功执行: {result.statement[:50]}...")
 
-        # 提交所有更改
+        # 恢复会话级约束检查，并一次性提交整个批处理
+        cursor.execute("SET SESSION unique_checks=1")
+        cursor.execute("SET SESSION foreign_key_checks=1")
         cnx.commit()
+
+        # 批处理结束后重连一次目标数据库，保证后续操作都落在新库上
+        cursor.close()
+        cnx.close()
+
+        db_config['database'] = db_name # 恢复 database key
+        cnx = mysql.connector.connect(**db_config)
+        cursor = cnx.cursor()
+        print(f"✅ 成功切换到数据库: {db_name}")
         print("\n🎉 数据库结构创建成功！")
 
     except mysql.connector.Error as err:
@@ -110,7 +92,7 @@ def execute_sql_script(sql_script, db_config):
 
 if __name__ == "__main__":
     try:
-        db_config = get_db_config()
+        db_config, _ = load_config()
         sql_script = load_sql_script(SCHEMA_SQL_FILE)
         execute_sql_script(sql_script, db_config)
     except Exception as e:
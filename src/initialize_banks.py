@@ -1,11 +1,7 @@
-import pandas as pd
-import configparser
-from sqlalchemy import create_engine, text
-from urllib.parse import quote_plus
+import mysql.connector
 import sys
 
-# 假设配置文件路径
-CONFIG_FILE = 'conf/settings.ini'
+from config import load_config
 
 # --------------------------
 # 核心数据：主要上市银行的名称和代码
@@ -57,87 +53,46 @@ BANK_DATA = [
     # ... (还有一些小型上市银行，此列表已覆盖主要标的)
 ]
 
-def get_db_config(filename=CONFIG_FILE):
-    """从配置文件中读取数据库配置"""
-    parser = configparser.ConfigParser()
-    if not parser.read(filename):
-        raise FileNotFoundError(f"错误：无法找到或读取配置文件: {filename}")
-    
-    return dict(parser.items('DATABASE'))
-
-def create_db_engine(config):
-    """创建 SQLAlchemy 数据库连接引擎，并对密码进行 URL 编码"""
-    encoded_password = quote_plus(config['password'])
-    db_url = (
-        f"mysql+mysqlconnector://{config['user']}:"
-        f"{encoded_password}@{config['host']}:{config['port']}/"
-        f"{config['database']}?charset=utf8mb4"
-    )
-    return create_engine(db_url)
-
-
 def initialize_banks_table():
     """将银行数据插入到 banks 表中，并确保 stock_code 是主键"""
     print("--- 银行数据初始化脚本启动 ---")
     try:
-        db_config = get_db_config()
-        engine = create_db_engine(db_config)
+        db_config, _ = load_config()
+        # 一次性的 35 行初始化直接用 mysql-connector 原生连接，
+        # 不再经过 SQLAlchemy 的引擎/方言层（小批量插入时该层开销占大头）
+        cnx = mysql.connector.connect(**db_config)
     except Exception as e:
         print(f"初始化失败，请检查配置文件和数据库连接: {e}")
         sys.exit(1)
 
-    df = pd.DataFrame(BANK_DATA)
     table_name = 'banks' # 目标表名
 
-    print(f"正在将 {len(df)} 条银行数据写入数据库表 '{table_name}'...")
-    
+    print(f"正在将 {len(BANK_DATA)} 条银行数据写入数据库表 '{table_name}'...")
+
     try:
-        # **步骤 1: 使用 if_exists='replace' 创建或替换表结构**
-        # 注意：这里可能会再次触发外键约束错误，因为 DROP TABLE 被拒绝。
-        # 我们使用 try-except 来捕获这个错误，然后直接进入下一步。
-        try:
-            df.to_sql(table_name, engine, if_exists='replace', index=False)
-            print(f"表 '{table_name}' 已成功创建或替换。")
-        except Exception as e:
-            # 捕获到外键删除错误，表示表已存在，我们继续。
-            if "Cannot drop table" in str(e):
-                print(f"表 '{table_name}' 存在外键约束，跳过 DROP TABLE 步骤。")
-            else:
-                raise e # 抛出其他非外键相关的错误
-        
-        
-        # **步骤 2: 确保 'stock_code' 是主键**
-        # 即使表已存在，我们也尝试执行 ALTER TABLE，确保主键存在。
-        # 如果主键已存在，MySQL 会友好地报错，我们用 try-except 忽略它。
-        primary_key_sql = text(f"ALTER TABLE {table_name} ADD PRIMARY KEY (stock_code);")
-        
-        with engine.connect() as connection:
-            try:
-                connection.execute(primary_key_sql)
-                connection.commit()
-                print("✅ 已将 'stock_code' 设置为主键。")
-            except Exception as e:
-                # 捕获主键已存在的错误 (如 Duplicate key name 'PRIMARY')，忽略
-                if "Duplicate key name" not in str(e):
-                    print(f"警告: 设置主键时发生意外错误: {e}")
-                
-        # **步骤 3: 使用 ON DUPLICATE KEY UPDATE 方式插入/更新数据**
+        cursor = cnx.cursor()
+
+        # **步骤 1: 确保 banks 表存在且 'stock_code' 唯一**
+        # CREATE TABLE IF NOT EXISTS 一次往返完成"不存在才建表"，
+        # 不再依赖"先 ALTER 再吞异常"的控制流；表已由 schema 脚本创建时
+        # 直接跳过（字段长度与 sql/01_schema_creation.sql 保持一致）
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table_name} ("
+            f"  bank_name VARCHAR(100) NOT NULL,"
+            f"  stock_code VARCHAR(20) NOT NULL PRIMARY KEY"
+            f") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+        )
+
+        # **步骤 2: 使用 ON DUPLICATE KEY UPDATE 方式插入/更新数据**
         # 这是最安全的方式：如果 stock_code 已存在，则更新 bank_name；否则插入。
-        
-        # 构建 MySQL 的 ON DUPLICATE KEY UPDATE 语句
-        values_clause = ", ".join([f"('{row['bank_name']}', '{row['stock_code']}')" for _, row in df.iterrows()])
-        
-        insert_update_sql = text(f"""
-            INSERT INTO {table_name} (bank_name, stock_code) VALUES {values_clause}
-            ON DUPLICATE KEY UPDATE
-                bank_name = VALUES(bank_name);
-        """)
-        
-        with engine.connect() as connection:
-            connection.execute(insert_update_sql)
-            connection.commit()
-            print(f"✅ 银行数据已使用 INSERT...ON DUPLICATE KEY UPDATE 方式成功更新/插入 {len(df)} 条。")
-
+        # executemany 会被驱动改写成单条多行 INSERT，一个网络包完成写入
+        cursor.executemany(
+            f"INSERT INTO {table_name} (bank_name, stock_code) VALUES (%s, %s) "
+            f"ON DUPLICATE KEY UPDATE bank_name = VALUES(bank_name)",
+            [(bank['bank_name'], bank['stock_code']) for bank in BANK_DATA]
+        )
+        cnx.commit()
+        print(f"✅ 银行数据已使用 INSERT...ON DUPLICATE KEY UPDATE 方式成功更新/插入 {len(BANK_DATA)} 条。")
 
         print("\n🎉 银行表初始化完毕！")
         print("您现在可以安全地运行数据爬取脚本了: python src/tushare_data_fetcher.py")
@@ -145,5 +100,9 @@ def initialize_banks_table():
     except Exception as e:
         print(f"\n❌ 数据写入失败。致命错误: {e}")
 
+    finally:
+        if cnx.is_connected():
+            cnx.close()
+
 if __name__ == "__main__":
     initialize_banks_table()
\ No newline at end of file
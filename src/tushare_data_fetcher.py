@@ -1,39 +1,23 @@
 import tushare as ts
+import numpy as np
 import pandas as pd
-import configparser
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.engine import Connection
 from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import os
+import threading
 import time
 import sys
 
-# 配置文件路径已修改为 'conf/settings.ini'
-CONFIG_FILE = 'conf/settings.ini' 
+from config import load_config
 
 # --------------------------
-# 1. 配置和数据库连接函数
+# 1. 数据库连接函数
 # --------------------------
 
-def get_config(filename=CONFIG_FILE):
-    """从配置文件中读取 Tushare 和数据库配置"""
-    parser = configparser.ConfigParser()
-    if not parser.read(filename):
-        # 考虑到运行环境可能在 src/ 内部，尝试相对路径
-        if not parser.read('../' + filename):
-            raise FileNotFoundError(f"错误：无法找到或读取配置文件: {filename} 或 ../{filename}")
-    
-    db_config = dict(parser.items('DATABASE'))
-    ts_token = parser.get('TSHARE', 'token')
-    
-    # 检查核心配置项
-    if not all(k in db_config for k in ['user', 'password', 'host', 'port', 'database']):
-        raise ValueError("错误：settings.ini 文件中 [DATABASE] 配置项不完整。")
-    if not ts_token:
-        raise ValueError("错误：settings.ini 文件中 [TSHARE] token 不能为空。")
-        
-    return db_config, ts_token
-
 def create_db_engine(config: dict) -> Engine:
     """创建 SQLAlchemy 数据库连接引擎，并对密码进行 URL 编码"""
     
@@ -48,7 +32,43 @@ def create_db_engine(config: dict) -> Engine:
     )
     
     print(f"尝试连接数据库: {config['database']}@{config['host']}:{config['port']}...")
-    return create_engine(db_url)
+    # 连接池按并发爬取线程数留出余量，保证每个 worker 都能拿到池化连接；
+    # pool_pre_ping 防止长时间爬取中使用被服务器断开的连接，
+    # pool_recycle 在 MySQL wait_timeout（默认 28800s）之前主动回收连接
+    engine = create_engine(
+        db_url,
+        pool_size=MAX_WORKERS * 2,
+        max_overflow=MAX_WORKERS,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    )
+
+    @event.listens_for(engine, 'connect')
+    def _relax_session_durability(dbapi_conn, connection_record):
+        # 批量写入会话放宽外键检查和落盘策略：每个 chunk 的提交都触发
+        # 校验和 redo log 刷盘，是 MySQL 批量插入慢的主因。ETL 幂等可重跑，
+        # 放宽仅限本会话，连接池的每个新连接都在此统一设置。
+        # 注意：不能关 unique_checks —— 本脚本的去重完全依赖重复键检测
+        # （INSERT IGNORE / ON DUPLICATE KEY UPDATE），关掉后 InnoDB 可能
+        # 跳过二级唯一索引校验，重跑时唯一键表会悄悄积累重复行
+        cursor = dbapi_conn.cursor()
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        try:
+            # 仅 Percona 等分支支持会话级设置；官方 MySQL 该变量为全局，
+            # 不在客户端擅自改全局落盘策略，失败时直接跳过
+            cursor.execute("SET SESSION innodb_flush_log_at_trx_commit = 2")
+        except Exception:
+            pass
+        cursor.close()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _log_executemany(conn, cursor, statement, parameters, context, executemany):
+        # mysql-connector 的 executemany 会把 INSERT ... VALUES 改写成
+        # 单条多行 INSERT 发送；在此打点确认批量路径生效（而非逐行 INSERT）
+        if executemany:
+            print(f"  [executemany] 单语句批量写入 {len(parameters)} 行")
+
+    return engine
 
 # --------------------------
 # 2. 数据接口和数据库映射
@@ -64,50 +84,131 @@ TABLE_MAPPING = {
 
 TS_API_LIST = list(TABLE_MAPPING.keys())
 
+# 支持按报告期 (period) 一次返回全市场数据的 VIP 批量接口
+# （dividend 没有对应的按报告期批量接口，仍按股票逐个拉取）
+BULK_PERIOD_APIS = ['income', 'balancesheet', 'fina_indicator']
+
+# 财报数据的起始年份（最早上市银行的财报从 2000 年前后开始有数据）
+REPORT_START_YEAR = 2000
+
+# 本地 Parquet 缓存目录和有效期：中断后重跑直接读盘，
+# 不再重复消耗 Tushare API 配额（重跑从网络受限变为磁盘 I/O 受限）
+CACHE_DIR = Path('cache')
+CACHE_TTL_SECONDS = 24 * 3600
+
+# --------------------------
+# 3. 并发和频率限制
+# --------------------------
+
+# 并发爬取线程数（受 Tushare 配额约束，而不是网络往返时间）
+MAX_WORKERS = 8
+
+# Tushare Pro 默认每分钟调用上限（积分不同可调整）
+RATE_LIMIT_PER_MIN = 500
+
+class TokenBucket:
+    """线程安全的令牌桶限流器，多线程共享同一 API 配额
+
+    按 rate_per_min 的速率持续补充令牌（懒计算，无需后台线程），
+    桶满时允许突发调用打满配额，桶空时 acquire 阻塞等待补充。
+    """
+
+    def __init__(self, rate_per_min: int):
+        self.capacity = rate_per_min
+        self.tokens = float(rate_per_min)       # 初始满桶
+        self.refill_per_sec = rate_per_min / 60.0
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取走一个令牌；桶空时按补充速率休眠后重试"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.last_refill) * self.refill_per_sec
+                )
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # 距离下一个令牌生成还需等待的时间
+                wait = (1 - self.tokens) / self.refill_per_sec
+            time.sleep(wait)
+
+# 全部爬取线程共享的限流器
+_rate_limiter = TokenBucket(RATE_LIMIT_PER_MIN)
+
 # --------------------------
-# 3. 核心数据爬取函数
+# 4. 核心数据爬取函数
 # --------------------------
 
-def get_bank_codes(engine: Engine) -> list:
-    """从 banks 表中读取所有银行的股票代码 (stock_code)"""
+def get_bank_codes(engine: Engine) -> tuple:
+    """从 banks 表中按代码升序读取所有银行的股票代码 (stock_code)"""
     print("--- 1. 从数据库读取银行股票代码 ---")
     try:
         # 假设 banks 表中的股票代码字段名为 stock_code
-        sql = "SELECT stock_code FROM banks;"
-        df = pd.read_sql(sql, engine)
-        
-        if df.empty:
+        # 直接取标量列表，省去 pd.read_sql 构造 DataFrame 再展平的开销
+        # ORDER BY 由 MySQL 走索引完成：后续按 ts_code 主键前缀的 upsert
+        # 以键序落盘，相邻代码命中同一批 InnoDB B+ 树页，缓冲池更友好
+        with engine.connect() as connection:
+            ts_codes = tuple(
+                connection.execute(
+                    text("SELECT stock_code FROM banks ORDER BY stock_code")
+                ).scalars().all()
+            )
+
+        if not ts_codes:
             print("警告：banks 表中没有找到任何股票代码。请先运行初始化脚本。")
-            return []
-            
-        ts_codes = df['stock_code'].tolist()
+            return ()
+
         print(f"成功读取 {len(ts_codes)} 个银行股票代码。")
         return ts_codes
-        
+
     except Exception as e:
         print(f"❌ 读取 banks 表失败。请确认表名是否存在。错误: {e}")
-        return []
+        return ()
+
+# 每次 execute 的行数上限：流式消费 data_iter，峰值内存只保留一个切片的
+# 字典副本，而不是整个 chunk 的完整拷贝（宽表每行 80+ 列时差异明显）
+_EXEC_BATCH_ROWS = 1000
+
+def _execute_batched(conn: Connection, insert_stmt, keys, data_iter):
+    """按固定大小的切片流式执行 executemany，返回累计 rowcount
+
+    SQLAlchemy 的 execute 只接受序列参数（生成器会抛 ArgumentError），
+    因此逐切片物化字典列表，而不是一次性物化整个 chunk。
+    """
+    keys = tuple(keys)
+    rowcount = 0
+    batch = []
+    for row in data_iter:
+        batch.append(dict(zip(keys, row)))
+        if len(batch) >= _EXEC_BATCH_ROWS:
+            rowcount += conn.execute(insert_stmt, batch).rowcount
+            batch = []
+    if batch:
+        rowcount += conn.execute(insert_stmt, batch).rowcount
+    return rowcount
 
 def mysql_insert_ignore(table, conn: Connection, keys, data_iter):
     """
     方法 A：用于 t_dividend 表。
     功能：实现 INSERT IGNORE，遇到重复的主键时，忽略该行数据。
     """
-    
+
     full_table_name = f"{table.schema}.{table.name}" if table.schema else table.name
     placeholders = [f":{key}" for key in keys]
-    
+
     # 构造 INSERT IGNORE INTO 语句
     sql_string = (
         f"INSERT IGNORE INTO {full_table_name} ({', '.join(keys)}) "
         f"VALUES ({', '.join(placeholders)})"
     )
-    
+
     insert_stmt = text(sql_string)
-    data_to_insert = [dict(zip(keys, row)) for row in data_iter]
-    
-    result = conn.execute(insert_stmt, data_to_insert)
-    return result.rowcount
+    return _execute_batched(conn, insert_stmt, keys, data_iter)
 
 
 def mysql_insert_update(table, conn: Connection, keys, data_iter):
@@ -141,69 +242,141 @@ def mysql_insert_update(table, conn: Connection, keys, data_iter):
     )
     
     insert_stmt = text(sql_string)
-    data_to_insert = [dict(zip(keys, row)) for row in data_iter]
-    
     # 批量执行语句
-    result = conn.execute(insert_stmt, data_to_insert)
-    return result.rowcount
+    return _execute_batched(conn, insert_stmt, keys, data_iter)
+
+# 并发写入时串行化各表的首次建表：目标 t_* 表不在 schema 脚本中，由
+# pandas to_sql 隐式创建，而它的"检查存在 -> CREATE TABLE"不是原子操作。
+# 空库上多个 worker 会同时通过存在性检查并竞争建表，败者报 1050 导致
+# 该批数据被悄悄丢弃（串行跑时不会触发）
+_table_locks = {name: threading.Lock() for name in TABLE_MAPPING.values()}
+_ready_tables = set()
+
+def _ensure_table_exists(df, engine: Engine, table_name: str):
+    """首个写入者持锁建表，之后所有并发写入都只是 append"""
+    if table_name in _ready_tables:
+        return
+    with _table_locks[table_name]:
+        if table_name in _ready_tables:
+            return
+        # head(0) 只建表不写行；表已存在时 append 空数据等于无操作
+        df.head(0).to_sql(table_name, engine, if_exists='append', index=False)
+        _ready_tables.add(table_name)
+
+def save_dataframe(df, engine: Engine, api_name: str, label: str):
+    """把一批接口数据写入对应的数据库表（label 仅用于日志标识）"""
 
-def fetch_and_save_data(pro, engine: Engine, ts_code: str, api_name: str):
-    """从 Tushare 获取数据并保存到数据库"""
-    
     table_name = TABLE_MAPPING[api_name]
 
     if api_name == 'dividend':
+        # 分红数据：INSERT IGNORE，遇到重复主键时忽略
         write_method = mysql_insert_ignore
-        print("  -> 使用 [INSERT IGNORE] 写入 (分红数据，忽略重复)。")
-        
     else:
+        # 财务数据：ON DUPLICATE KEY UPDATE（含 update_flag 的表只有修正数据才更新）
         write_method = mysql_insert_update
-        if api_name in ['income', 'balancesheet']:
-            # 包含 update_flag 的表
-            print("  -> 使用 [ON DUPLICATE KEY UPDATE with UPDATE_FLAG] 写入 (只有修正数据才更新)。")
-        else:
-            # 不含 update_flag 的表 (如 fina_indicator)
-            print("  -> 使用 [ON DUPLICATE KEY UPDATE] 写入 (全字段覆盖更新)。")
-    
+
     try:
-        # 获取对应的 Tushare 接口函数
-        ts_func = getattr(pro, api_name)
-        
-        # 拉取该股票的所有历史数据
-        # 财务数据接口通常使用 period 或 ann_date 过滤，这里不加日期限制，拉取全部历史数据
-        df = ts_func(ts_code=ts_code, limit=0) # limit=0 相当于不限制，拉取全部
-        
-        if df.empty:
-            # print(f"  -> {ts_code} 在 {api_name} 接口中无数据。")
-            return
-        
         if 'update_flag' in df.columns:
-        # 将 update_flag 列转换为整数，并用 0 填充缺失值（NaN）
-            df['update_flag'] = df['update_flag'].fillna(0).astype(int)
-            
+            # 将 update_flag 列转换为整数，并用 0 填充缺失值（NaN）
+            # 一次 NumPy 类型转换完成填充+转型，不产生 fillna 的中间 Series；
+            # 0/1 标志位用 int8 存储即可，内存占用只有 int64 的 1/8
+            df['update_flag'] = np.nan_to_num(
+                df['update_flag'].to_numpy(dtype=np.float64), nan=0
+            ).astype(np.int8)
+
+        # 确保目标表已建好，之后的并发 to_sql 都只走 append 路径
+        _ensure_table_exists(df, engine, table_name)
+
+        # 按列数计算每批行数：MySQL 单条语句占位符上限为 65535，
+        # 宽表（如 fina_indicator 的 80+ 列）按 5000 行分批会超限
+        chunksize = max(1, 65000 // len(df.columns))
+
         # 写入数据库：使用 append 模式，依赖数据库表的主键实现去重和更新。
         # 注意：这要求目标表（t_income, t_balancesheet等）已正确设置复合主键（如 ts_code + end_date）
         df.to_sql(
-            table_name, 
-            engine, 
-            if_exists='append', 
-            index=False, 
-            chunksize=5000,
+            table_name,
+            engine,
+            if_exists='append',
+            index=False,
+            chunksize=chunksize,
             method=write_method  # <-- 关键修改：使用自定义的去重方法
         )
-        print(f"  -> {api_name} 数据成功存入 {len(df)} 行 (重复行已忽略)。")
+        print(f"  -> {label} 的 {api_name} 数据成功存入 {len(df)} 行 (重复行已忽略)。")
 
     except Exception as db_error:
-        # ... (错误捕获逻辑不变) ...
         # 即使使用了 INSERT IGNORE，某些底层连接错误仍可能发生，保留捕获
-        print(f"  ❌ 数据库写入失败：{ts_code} 的 {api_name} 写入 {table_name} 时出错。")
+        print(f"  ❌ 数据库写入失败：{label} 的 {api_name} 写入 {table_name} 时出错。")
         print(f"     错误信息: {db_error.__class__.__name__}: {db_error}")
 
+def quarter_end_periods(start_year: int) -> list:
+    """生成 start_year 至今的所有季度末报告期（YYYYMMDD 字符串列表）"""
+    today = time.strftime('%Y%m%d')
+    periods = []
+    for year in range(start_year, int(today[:4]) + 1):
+        for month_day in ('0331', '0630', '0930', '1231'):
+            period = f"{year}{month_day}"
+            if period <= today:
+                periods.append(period)
+    return periods
+
+def _fetch_with_cache(ts_func, api_name: str, cache_key: str, **params):
+    """优先读本地 Parquet 缓存，未命中或过期时调用 Tushare 并回写缓存"""
+    cache_path = CACHE_DIR / api_name / f"{cache_key}.parquet"
+
+    if cache_path.exists() and time.time() - cache_path.stat().st_mtime < CACHE_TTL_SECONDS:
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception as e:
+            # 缓存文件损坏（比如上次进程在写入中途被杀）：删掉坏文件，
+            # 继续走正常拉取路径，而不是整个 TTL 期内一直跳过该任务
+            print(f"  ⚠️ 缓存文件损坏，已删除并重新拉取: {cache_path} ({e})")
+            cache_path.unlink(missing_ok=True)
+
+    # 遵循 Tushare API 频率限制：从令牌桶取一个令牌，桶空时阻塞等待补充
+    _rate_limiter.acquire()
+    df = ts_func(**params)
+
+    # 先写临时文件再原子替换：进程中途被杀不会留下 mtime 很新的半截
+    # 缓存文件去污染后续的重跑
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, cache_path)
+    return df
+
+def fetch_and_save_period(ts_func, engine: Engine, api_name: str, period: str, bank_codes: set):
+    """按报告期批量拉取全市场数据，过滤出银行后保存（VIP 批量接口）"""
+    try:
+        # VIP 接口按 period 一次返回该报告期全市场的数据
+        df = _fetch_with_cache(ts_func, api_name, period, period=period)
+
+        if df.empty:
+            return
+
+        # 过滤出目标银行（copy 避免在切片视图上原地修改）
+        df = df[df['ts_code'].isin(bank_codes)].copy()
+        if df.empty:
+            return
+
+        save_dataframe(df, engine, api_name, period)
+
+    except Exception as e:
+        print(f"  ❌ 爬取报告期 {period} 的 {api_name} 数据时发生错误: {e}")
+
+def fetch_and_save_data(ts_func, engine: Engine, ts_code: str, api_name: str):
+    """按股票逐个拉取数据并保存（用于无批量接口的 dividend）"""
+    try:
+        # 拉取该股票的所有历史数据（limit=0 相当于不限制，拉取全部）
+        df = _fetch_with_cache(ts_func, api_name, ts_code, ts_code=ts_code, limit=0)
+
+        if df.empty:
+            # print(f"  -> {ts_code} 在 {api_name} 接口中无数据。")
+            return
+
+        save_dataframe(df, engine, api_name, ts_code)
+
     except Exception as e:
         print(f"  ❌ 爬取 {ts_code} 的 {api_name} 数据时发生错误: {e}")
-    finally:
-        # 遵循 Tushare API 频率限制，每次调用后暂停
-        time.sleep(0.1) 
 
 def run_fetcher():
     """主执行函数"""
@@ -211,7 +384,9 @@ def run_fetcher():
     
     try:
         # 1. 初始化配置和连接
-        db_config, ts_token = get_config()
+        db_config, ts_token = load_config()
+        if not ts_token:
+            raise ValueError("错误：settings.ini 文件中 [TSHARE] token 不能为空。")
         pro = ts.pro_api(ts_token)
         engine = create_db_engine(db_config)
         
@@ -229,17 +404,37 @@ def run_fetcher():
     if not bank_codes:
         sys.exit(0)
 
-    print("\n--- 3. 循环爬取并存储银行数据 ---")
-    
+    print("\n--- 3. 并发爬取并存储银行数据 ---")
+
     start_time = time.time()
-    total_codes = len(bank_codes)
-    
-    for i, ts_code in enumerate(bank_codes):
-        print(f"\n[{i+1}/{total_codes}] 开始处理银行: {ts_code}")
-        
-        for api_name in TS_API_LIST:
-            fetch_and_save_data(pro, engine, ts_code, api_name)
-            
+
+    # 启动时解析一次接口函数，避免每次调用都经过 getattr 和 tushare 内部分发
+    # 财务三表走 VIP 批量接口（income_vip 等），dividend 仍走普通接口
+    api_funcs = {
+        api_name: getattr(pro, api_name + '_vip') if api_name in BULK_PERIOD_APIS
+        else getattr(pro, api_name)
+        for api_name in TS_API_LIST
+    }
+
+    # 财务三表按 (接口名, 报告期) 拆分任务：VIP 接口一次返回全市场数据，
+    # HTTP 调用次数从 银行数×接口数 降为 报告期数×接口数，与银行数量无关
+    periods = quarter_end_periods(REPORT_START_YEAR)
+    bank_code_set = set(bank_codes)
+    period_jobs = [(api_name, period) for api_name in BULK_PERIOD_APIS for period in periods]
+
+    print(f"共 {len(period_jobs)} 个批量任务 + {len(bank_codes)} 个分红任务，"
+          f"使用 {MAX_WORKERS} 个并发线程。")
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(
+            lambda job: fetch_and_save_period(api_funcs[job[0]], engine, job[0], job[1], bank_code_set),
+            period_jobs
+        ))
+        list(executor.map(
+            lambda ts_code: fetch_and_save_data(api_funcs['dividend'], engine, ts_code, 'dividend'),
+            bank_codes
+        ))
+
     end_time = time.time()
     print(f"\n--- 爬取完成！总耗时: {end_time - start_time:.2f} 秒 ---")
 